@@ -2,11 +2,47 @@
 Email agent that combines email client with LLM capabilities.
 """
 
+import asyncio
+import json
+import re
+import threading
+import time
 from dataclasses import dataclass
 from typing import Optional
-from email_client import EmailClient, Email
+from email_client import EmailClient, Email, PREVIEW_BODY_BYTES
 from llm_client import LLMClient
-from config import agent_config
+from cache import CACHE_DIR, LLMCache, TemplateCache
+from config import get_agent_config
+
+# Priority is read from the first word only, ignoring markdown like "**"
+_PRIORITY_RE = re.compile(r"\W*(HIGH|MEDIUM|LOW)\b", re.IGNORECASE)
+
+STATUS_PATH = CACHE_DIR / "status.json"
+
+_DELETABLE_CRITERIA = """DELETABLE emails are:
+- Newsletters you probably won't read
+- Marketing/promotional emails
+- Automated notifications that aren't actionable
+- Spam or junk
+- Social media notifications
+- Old/expired offers or events
+
+KEEP emails are:
+- Personal messages from real people
+- Work-related communications
+- Emails requiring action or response
+- Important receipts or confirmations
+- Account security alerts"""
+
+_SUMMARY_TMPL = """
+**{subject}**
+From: {sender}
+Category: {category}
+
+{summary}
+
+---
+""".format_map
 
 
 @dataclass
@@ -22,49 +58,158 @@ class EmailSummary:
 class EmailAgent:
     """AI-powered email agent for managing your inbox."""
 
+    # Seconds a successful connection check is trusted before probing again
+    STATUS_TTL = 30
+
     def __init__(self):
         self.email_client = EmailClient()
         self.llm = LLMClient()
-        self.config = agent_config
-
-    def check_connections(self) -> dict:
-        """Check if all services are connected."""
-        email_ok = self.email_client.connect()
-        llm_ok = self.llm.check_connection()
+        self.config = get_agent_config()
+        self.cache = LLMCache()
+        self.templates = TemplateCache()
+        # A single long-lived loop: the async HTTP client keeps pooled
+        # connections bound to the loop it first ran on.
+        self._loop = asyncio.new_event_loop()
+        self._status = None
+
+        if self.config.prefetch_emails > 0:
+            # Warm the email cache in the background while the menu is up
+            threading.Thread(
+                target=self.email_client.prefetch,
+                kwargs={"limit": self.config.prefetch_emails},
+                daemon=True
+            ).start()
+
+    def _run(self, coro):
+        """Run a coroutine to completion on the agent's event loop."""
+        return self._loop.run_until_complete(coro)
+
+    def _iterate(self, agen):
+        """Drive an async generator on the agent's event loop as a plain generator."""
+        async def step():
+            return await agen.__anext__()
+
+        try:
+            while True:
+                task = self._loop.create_task(step())
+                try:
+                    item = self._run(task)
+                except StopAsyncIteration:
+                    return
+                except BaseException:
+                    # Interrupted mid-step (e.g. Ctrl-C): cancel the step and let
+                    # the generator unwind before re-raising
+                    task.cancel()
+                    try:
+                        self._run(task)
+                    except BaseException:
+                        pass
+                    raise
+                yield item
+        finally:
+            self._run(agen.aclose())
+
+    def close(self):
+        """Close the IMAP connection and HTTP pools held open across operations."""
         self.email_client.disconnect()
+        self.templates.flush()
+        self.llm.close()
+        self._run(self.llm.aclose())
+        self._loop.close()
+
+    def _recent_status(self) -> Optional[dict]:
+        """Return a ready status checked within STATUS_TTL, from this or a previous run."""
+        if self._status is None:
+            try:
+                self._status = json.loads(STATUS_PATH.read_text())
+            except (OSError, ValueError):
+                self._status = {}
+
+        if self._status.get("ready") and time.time() - self._status.get("checked_at", 0) < self.STATUS_TTL:
+            return {key: self._status[key] for key in ("email", "llm", "ready")}
+        return None
+
+    def check_connections(self, force: bool = False) -> dict:
+        """Check if all services are connected, reusing a recent successful check unless forced."""
+        if not force:
+            status = self._recent_status()
+            if status:
+                return status
+
+        email_ok = self.email_client.ensure_connected(probe=force)
+        llm_ok = self.llm.check_connection()
 
-        return {
+        status = {
             "email": email_ok,
             "llm": llm_ok,
             "ready": email_ok and llm_ok
         }
 
+        self._status = {**status, "checked_at": time.time()}
+        # Only successes are worth trusting later; failures are always re-probed
+        if status["ready"]:
+            try:
+                STATUS_PATH.parent.mkdir(parents=True, exist_ok=True)
+                STATUS_PATH.write_text(json.dumps(self._status))
+            except OSError:
+                pass
+        return status
+
+    async def _bounded(self, sem: asyncio.Semaphore, func, *args):
+        """Await func(*args) while holding the semaphore."""
+        async with sem:
+            return await func(*args)
+
+    async def aget_inbox_summary(self, limit: int = None, unread_only: bool = True) -> list[EmailSummary]:
+        """Get a summary of recent emails, analyzing them concurrently."""
+        limit = limit or self.config.max_emails_to_fetch
+
+        with self.email_client as client:
+            emails = client.fetch_emails(limit=limit, unread_only=unread_only)
+
+        sem = asyncio.Semaphore(self.config.max_concurrent_llm)
+        return await asyncio.gather(*[
+            self._bounded(sem, self.aprocess_email, email) for email in emails
+        ])
+
     def get_inbox_summary(self, limit: int = None, unread_only: bool = True) -> list[EmailSummary]:
         """Get a summary of recent emails."""
+        return self._run(self.aget_inbox_summary(limit=limit, unread_only=unread_only))
+
+    async def _aprocess_as_completed(self, emails: list[Email]):
+        """Yield (index, summary) pairs as the concurrent analyses finish."""
+        sem = asyncio.Semaphore(self.config.max_concurrent_llm)
+
+        async def process(index, email):
+            return index, await self._bounded(sem, self.aprocess_email, email)
+
+        tasks = [asyncio.ensure_future(process(i, email)) for i, email in enumerate(emails)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The consumer may stop early; don't leave analyses running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def aiter_inbox_summary(self, limit: int = None, unread_only: bool = True):
+        """Yield summaries of recent emails in the order they complete."""
         limit = limit or self.config.max_emails_to_fetch
-        summaries = []
 
         with self.email_client as client:
             emails = client.fetch_emails(limit=limit, unread_only=unread_only)
 
-            for email in emails:
-                summary = EmailSummary(
-                    email=email,
-                    summary=self.llm.summarize(
-                        f"Subject: {email.subject}\n\n{email.body}",
-                        max_words=self.config.summary_max_words
-                    ),
-                    category=self.llm.categorize(email.subject, email.body),
-                    action_items=self.llm.extract_action_items(email.body),
-                    priority=self._determine_priority(email)
-                )
-                summaries.append(summary)
-
-        return summaries
-
-    def _determine_priority(self, email: Email) -> str:
-        """Determine email priority based on content."""
-        prompt = f"""Rate the priority of this email as HIGH, MEDIUM, or LOW.
+        async for _, summary in self._aprocess_as_completed(emails):
+            yield summary
+
+    def iter_inbox_summary(self, limit: int = None, unread_only: bool = True):
+        """Yield summaries of recent emails as soon as each is ready."""
+        return self._iterate(self.aiter_inbox_summary(limit=limit, unread_only=unread_only))
+
+    def _priority_prompt(self, email: Email) -> str:
+        """Build the prompt used to rate an email's priority."""
+        return f"""Rate the priority of this email as HIGH, MEDIUM, or LOW.
 Consider urgency, sender importance, and deadlines.
 Only respond with one word: HIGH, MEDIUM, or LOW.
 
@@ -73,48 +218,140 @@ From: {email.sender}
 
 {email.body[:500]}"""
 
-        response = self.llm.chat(prompt).strip().upper()
+    def _parse_priority(self, response: str) -> str:
+        """Map a raw LLM response onto HIGH, MEDIUM or LOW."""
+        match = _PRIORITY_RE.match(response)
+        return match.group(1).upper() if match else "MEDIUM"
 
-        if "HIGH" in response:
-            return "HIGH"
-        elif "LOW" in response:
-            return "LOW"
-        return "MEDIUM"
+    async def _adetermine_priority(self, email: Email) -> str:
+        """Determine email priority based on content."""
+        response = await self.llm.achat_short(self._priority_prompt(email))
+        return self._parse_priority(response)
 
     def draft_reply(self, email: Email, instructions: str = None) -> str:
         """Draft a reply to an email."""
         return self.llm.draft_reply(email.subject, email.body, instructions)
 
-    def process_email(self, email: Email) -> EmailSummary:
-        """Fully process a single email."""
+    def stream_reply(self, email: Email, instructions: str = None):
+        """Yield a reply draft as it is generated."""
+        return self.llm.stream_reply(email.subject, email.body, instructions)
+
+    async def _acached(self, key: str, kind: str, make) -> str:
+        """Return a cached LLM result, calling make() and storing it on a miss."""
+        response = self.cache.get(key, kind)
+        if response is None:
+            errors = self.llm.error_count
+            response = await make()
+            # Never cache failures (or defaults parsed from them), so the next run retries
+            if self.llm.error_count == errors:
+                self.cache.set(key, kind, response)
+        return response
+
+    def clear_cache(self):
+        """Forget all cached LLM results and template verdicts."""
+        self.cache.clear()
+        self.templates.clear()
+
+    async def _aprocess_separately(self, email: Email, key: str) -> EmailSummary:
+        """Process an email with one request per field, issued concurrently."""
+        errors = self.llm.error_count
+        summary, category, action_items, priority = await asyncio.gather(
+            self._acached(key, "summary", lambda: self.llm.asummarize(
+                f"Subject: {email.subject}\n\n{email.body}",
+                max_words=self.config.summary_max_words
+            )),
+            self._acached(key, "category", lambda: self.llm.acategorize(email.subject, email.body)),
+            self._acached(key, "action_items", lambda: self.llm.aextract_action_items(email.body)),
+            self._acached(key, "priority", lambda: self._adetermine_priority(email))
+        )
+
+        if self.llm.error_count == errors:
+            self.templates.put(email, category=category, priority=priority)
         return EmailSummary(
             email=email,
-            summary=self.llm.summarize(
-                f"Subject: {email.subject}\n\n{email.body}",
+            summary=summary,
+            category=category,
+            action_items=action_items,
+            priority=priority
+        )
+
+    async def aprocess_email(self, email: Email) -> EmailSummary:
+        """Fully process a single email with one structured LLM request."""
+        key = self.cache.key_for(email)
+        cached = self.cache.get(key, "analysis")
+
+        if cached:
+            analysis = json.loads(cached)
+        else:
+            analysis = await self.llm.aanalyze_email(
+                email.subject, email.sender, email.body,
                 max_words=self.config.summary_max_words
-            ),
-            category=self.llm.categorize(email.subject, email.body),
-            action_items=self.llm.extract_action_items(email.body),
-            priority=self._determine_priority(email)
+            )
+            if analysis is None:
+                # The model did not return usable JSON; ask field by field
+                return await self._aprocess_separately(email, key)
+            self.cache.set(key, "analysis", json.dumps(analysis))
+
+        priority = self._parse_priority(analysis["priority"])
+        self.templates.put(email, category=analysis["category"], priority=priority)
+        return EmailSummary(
+            email=email,
+            summary=analysis["summary"],
+            category=analysis["category"],
+            action_items=analysis["action_items"],
+            priority=priority
         )
 
+    def process_email(self, email: Email) -> EmailSummary:
+        """Fully process a single email."""
+        return self._run(self.aprocess_email(email))
+
+    async def _acategorize(self, email: Email) -> str:
+        """Categorize one email, caching the answer by content and by template."""
+        errors = self.llm.error_count
+        category = await self._acached(
+            self.cache.key_for(email), "category",
+            lambda: self.llm.acategorize(email.subject, email.body)
+        )
+        if self.llm.error_count == errors:
+            self.templates.put(email, category=category)
+        return category
+
+    async def _acategorize_all(self, emails: list[Email]) -> list[str]:
+        """Categorize emails concurrently, asking the LLM only about unknown templates."""
+        # Recurring templates (newsletters, notifications) skip the LLM
+        categories = [self.templates.get(email, "category") for email in emails]
+        unknown = [i for i, category in enumerate(categories) if category is None]
+
+        sem = asyncio.Semaphore(self.config.max_concurrent_llm)
+        answers = await asyncio.gather(*(
+            self._bounded(sem, self._acategorize, emails[i]) for i in unknown
+        ))
+        for i, category in zip(unknown, answers):
+            categories[i] = category
+        return categories
+
     def organize_inbox(self, dry_run: bool = True) -> list[dict]:
         """Organize emails by moving them to appropriate folders."""
         results = []
+        # Destination folder -> actions to move there, applied in batches
+        moves: dict[str, list[dict]] = {}
 
         with self.email_client as client:
             emails = client.fetch_emails(limit=self.config.max_emails_to_fetch)
             folders = client.get_folders()
+            # Lowercase folder names once; exact matches win over substrings
+            folder_lc = [(folder.lower(), folder) for folder in folders]
+            exact = {}
+            for lower, folder in folder_lc:
+                exact.setdefault(lower, folder)
 
-            for email in emails:
-                category = self.llm.categorize(email.subject, email.body)
-
+            for email, category in zip(emails, self._run(self._acategorize_all(emails))):
                 # Find matching folder (case-insensitive)
-                target_folder = None
-                for folder in folders:
-                    if category.lower() in folder.lower():
-                        target_folder = folder
-                        break
+                cl = category.lower()
+                target_folder = exact.get(cl)
+                if target_folder is None:
+                    target_folder = next((folder for lower, folder in folder_lc if cl in lower), None)
 
                 action = {
                     "email_id": email.id,
@@ -125,10 +362,16 @@ From: {email.sender}
                 }
 
                 if target_folder and not dry_run:
-                    action["moved"] = client.move_email(email.id, target_folder)
+                    moves.setdefault(target_folder, []).append(action)
 
                 results.append(action)
 
+            for dest_folder, actions in moves.items():
+                moved = client.move_emails([a["email_id"] for a in actions], dest_folder)
+                for action in actions:
+                    action["moved"] = moved
+
+        self.templates.flush()
         return results
 
     def get_daily_digest(self) -> str:
@@ -138,34 +381,44 @@ From: {email.sender}
         if not summaries:
             return "No unread emails to summarize."
 
-        digest_parts = [f"# Daily Email Digest\n\nYou have {len(summaries)} unread email(s).\n"]
+        return self._build_digest(summaries, len(summaries))
+
+    async def aiter_daily_digest(self):
+        """Yield the digest rebuilt as each unread email's summary completes."""
+        with self.email_client as client:
+            emails = client.fetch_emails(limit=self.config.max_emails_to_fetch, unread_only=True)
 
-        # Group by priority
-        high = [s for s in summaries if s.priority == "HIGH"]
-        medium = [s for s in summaries if s.priority == "MEDIUM"]
-        low = [s for s in summaries if s.priority == "LOW"]
+        if not emails:
+            yield "No unread emails to summarize."
+            return
 
-        if high:
-            digest_parts.append("\n## High Priority\n")
-            for s in high:
-                digest_parts.append(self._format_summary(s))
+        done = {}
+        async for index, summary in self._aprocess_as_completed(emails):
+            done[index] = summary
+            # Keep inbox order within each section as summaries arrive out of order
+            yield self._build_digest([done[i] for i in sorted(done)], len(emails))
 
-        if medium:
-            digest_parts.append("\n## Medium Priority\n")
-            for s in medium:
-                digest_parts.append(self._format_summary(s))
+    def stream_daily_digest(self):
+        """Yield progressively more complete digests as summaries are generated."""
+        return self._iterate(self.aiter_daily_digest())
 
-        if low:
-            digest_parts.append("\n## Low Priority\n")
-            for s in low:
-                digest_parts.append(self._format_summary(s))
+    def _build_digest(self, summaries: list[EmailSummary], total: int) -> str:
+        """Render summaries as digest markdown."""
+        digest_parts = [f"# Daily Email Digest\n\nYou have {total} unread email(s).\n"]
 
-        # Collect all action items
+        # Group by priority and collect action items in a single pass
+        buckets = {"HIGH": [], "MEDIUM": [], "LOW": []}
         all_actions = []
         for s in summaries:
+            buckets.get(s.priority, buckets["MEDIUM"]).append(s)
             if "no action" not in s.action_items.lower():
                 all_actions.append(f"From '{s.email.subject}':\n{s.action_items}")
 
+        for priority, heading in (("HIGH", "High"), ("MEDIUM", "Medium"), ("LOW", "Low")):
+            if buckets[priority]:
+                digest_parts.append(f"\n## {heading} Priority\n")
+                digest_parts.extend(self._format_summary(s) for s in buckets[priority])
+
         if all_actions:
             digest_parts.append("\n## All Action Items\n")
             digest_parts.extend(all_actions)
@@ -174,34 +427,18 @@ From: {email.sender}
 
     def _format_summary(self, summary: EmailSummary) -> str:
         """Format an email summary for display."""
-        return f"""
-**{summary.email.subject}**
-From: {summary.email.sender}
-Category: {summary.category}
-
-{summary.summary}
-
----
-"""
-
-    def _is_deletable(self, email: Email) -> bool:
+        return _SUMMARY_TMPL({
+            "subject": summary.email.subject,
+            "sender": summary.email.sender,
+            "category": summary.category,
+            "summary": summary.summary
+        })
+
+    async def _ais_deletable(self, email: Email) -> bool:
         """Use LLM to determine if an email is deletable (low importance)."""
         prompt = f"""Analyze this email and determine if it is DELETABLE or KEEP.
 
-DELETABLE emails are:
-- Newsletters you probably won't read
-- Marketing/promotional emails
-- Automated notifications that aren't actionable
-- Spam or junk
-- Social media notifications
-- Old/expired offers or events
-
-KEEP emails are:
-- Personal messages from real people
-- Work-related communications
-- Emails requiring action or response
-- Important receipts or confirmations
-- Account security alerts
+{_DELETABLE_CRITERIA}
 
 Only respond with one word: DELETABLE or KEEP
 
@@ -210,18 +447,93 @@ Subject: {email.subject}
 
 {email.body[:300]}"""
 
-        response = self.llm.chat(prompt).strip().upper()
+        response = (await self.llm.achat_short(prompt)).strip().upper()
         return "DELETABLE" in response
 
-    def find_deletable_emails(self, limit: int = 50) -> dict:
-        """Find deletable emails and group them by sender."""
-        deletable_by_sender = {}
-
-        with self.email_client as client:
-            emails = client.fetch_emails(limit=limit, unread_only=False)
+    def _deletable_batch_prompt(self, emails: list[Email]) -> tuple[str, str]:
+        """Build the (prompt, system_prompt) pair to classify several emails at once."""
+        system_prompt = f"""You decide which emails are DELETABLE and which to KEEP.
+
+{_DELETABLE_CRITERIA}
+
+Return JSON of the form {{"results": [{{"id": 1, "deletable": true}}, ...]}}
+with one entry for every email id."""
+
+        items = [
+            f"[id={i}]\nFrom: {email.sender}\nSubject: {email.subject}\n{email.body[:300]}"
+            for i, email in enumerate(emails, 1)
+        ]
+        prompt = "Classify these emails:\n\n" + "\n\n".join(items)
+        return prompt, system_prompt
+
+    def _parse_deletable_batch(self, response: str, count: int) -> dict[int, bool]:
+        """Parse a batch verdict into {1-based index: deletable}, skipping bad entries."""
+        try:
+            results = json.loads(response).get("results", [])
+        except (json.JSONDecodeError, AttributeError):
+            return {}
+
+        verdicts = {}
+        for item in results if isinstance(results, list) else []:
+            if isinstance(item, dict) and isinstance(item.get("id"), int) and 1 <= item["id"] <= count:
+                verdicts[item["id"]] = bool(item.get("deletable"))
+        return verdicts
+
+    async def _aclassify_deletable(self, emails: list[Email], sem: asyncio.Semaphore) -> list[bool]:
+        """Classify a batch of emails, asking the LLM only about unknown templates.
+
+        Every LLM request, including per-email fallbacks, holds a slot of sem.
+        """
+        known = {i: self.templates.get(email, "deletable") for i, email in enumerate(emails, 1)}
+        unknown = [email for i, email in enumerate(emails, 1) if known[i] is None]
+
+        verdicts = {}
+        if unknown:
+            errors = self.llm.error_count
+            async with sem:
+                response = await self.llm.achat(*self._deletable_batch_prompt(unknown), json_mode=True)
+            verdicts = self._parse_deletable_batch(response, len(unknown))
+
+            # Ask individually about anything the batch answer left out
+            missing = [i for i in range(1, len(unknown) + 1) if i not in verdicts]
+            answers = await asyncio.gather(*(
+                self._bounded(sem, self._ais_deletable, unknown[i - 1]) for i in missing
+            ))
+            verdicts.update(zip(missing, answers))
+
+            if self.llm.error_count == errors:
+                for i, email in enumerate(unknown, 1):
+                    self.templates.put(email, deletable=verdicts[i])
+
+        asked = iter(range(1, len(unknown) + 1))
+        return [known[i] if known[i] is not None else verdicts[next(asked)] for i in range(1, len(emails) + 1)]
+
+    async def afind_deletable_emails(self, emails: list[Email], batch_size: int = None, on_progress=None) -> dict:
+        """Classify emails in concurrent batches and group the deletable ones by sender.
+
+        on_progress(done, total) is called as each batch completes.
+        """
+        batch_size = batch_size or self.config.llm_batch_size
+        sem = asyncio.Semaphore(self.config.max_concurrent_llm)
+        batches = [emails[start:start + batch_size] for start in range(0, len(emails), batch_size)]
+        done = 0
+
+        async def classify(batch):
+            nonlocal done
+            verdicts = await self._aclassify_deletable(batch, sem)
+            done += len(batch)
+            if on_progress:
+                on_progress(done, len(emails))
+            return verdicts
+
+        # gather keeps results in batch order, so grouping stays in inbox order
+        results = await asyncio.gather(*(classify(batch) for batch in batches))
+        self.templates.flush()
 
-            for email in emails:
-                if self._is_deletable(email):
+        deletable_by_sender = {}
+        for batch, verdicts in zip(batches, results):
+            for email, deletable in zip(batch, verdicts):
+                if deletable:
                     # Extract sender email/name for grouping
                     sender = email.sender
 
@@ -242,26 +554,22 @@ Subject: {email.subject}
 
         return deletable_by_sender
 
+    def find_deletable_emails_batched(self, emails: list[Email], batch_size: int = None, on_progress=None) -> dict:
+        """Classify emails in batches and group the deletable ones by sender."""
+        return self._run(self.afind_deletable_emails(emails, batch_size, on_progress))
+
+    def find_deletable_emails(self, limit: int = 50, on_progress=None) -> dict:
+        """Find deletable emails and group them by sender."""
+        with self.email_client as client:
+            # Classification and the preview only look at the start of each body
+            emails = client.fetch_emails(limit=limit, unread_only=False, max_body_bytes=PREVIEW_BODY_BYTES)
+
+        return self.find_deletable_emails_batched(emails, on_progress=on_progress)
+
     def delete_email(self, email_id: str) -> bool:
         """Delete a single email by ID."""
-        with self.email_client as client:
-            try:
-                client.imap.store(email_id.encode(), "+FLAGS", "\\Deleted")
-                client.imap.expunge()
-                return True
-            except Exception as e:
-                print(f"Error deleting email: {e}")
-                return False
-
-    def delete_emails_from_sender(self, email_ids: list) -> int:
-        """Delete multiple emails. Returns count of deleted."""
-        deleted = 0
-        with self.email_client as client:
-            for email_id in email_ids:
-                try:
-                    client.imap.store(email_id.encode(), "+FLAGS", "\\Deleted")
-                    deleted += 1
-                except:
-                    pass
-            client.imap.expunge()
-        return deleted
+        return self.email_client.delete_email(email_id)
+
+    def delete_emails_bulk(self, email_ids: list[str]) -> int:
+        """Delete any number of emails in one round of STORE and EXPUNGE. Returns count of deleted."""
+        return self.email_client.delete_emails(email_ids)
@@ -0,0 +1,213 @@
+"""
+Persistent caches for LLM results so emails are not re-analyzed.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from email_client import Email
+
+CACHE_DIR = Path.home() / ".cache" / "email-agent"
+CACHE_PATH = CACHE_DIR / "llm_cache.db"
+
+
+class _SQLiteStore:
+    """Lazily opened SQLite database holding one cache table."""
+
+    TABLE = ""
+    SCHEMA = ""
+
+    def __init__(self, path: Path = None):
+        self.path = path or CACHE_PATH
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database once, creating it on first use."""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.SCHEMA)
+        return self._conn
+
+    def clear(self):
+        """Remove every entry."""
+        try:
+            with self._connect() as conn:
+                conn.execute(f"DELETE FROM {self.TABLE}")
+        except sqlite3.Error as e:
+            print(f"Error clearing cache: {e}")
+
+
+class LLMCache(_SQLiteStore):
+    """SQLite-backed cache of LLM responses keyed by email content."""
+
+    TABLE = "llm_cache"
+    SCHEMA = """CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        response TEXT NOT NULL,
+        ts REAL NOT NULL,
+        PRIMARY KEY (key, kind)
+    )"""
+
+    # Entries kept in memory in front of SQLite
+    MEMORY_SIZE = 4096
+
+    def __init__(self, path: Path = None):
+        super().__init__(path)
+        self._memory: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def key_for(email: Email) -> str:
+        """Build a stable cache key from an email's identity and content."""
+        data = f"{email.id}|{email.subject}|{email.body[:2000]}"
+        return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str, kind: str) -> Optional[str]:
+        """Return the cached response, or None on a miss."""
+        if (key, kind) in self._memory:
+            self._memory.move_to_end((key, kind))
+            return self._memory[(key, kind)]
+
+        try:
+            row = self._connect().execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND kind = ?", (key, kind)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading LLM cache: {e}")
+            return None
+
+        if row:
+            self._remember(key, kind, row[0])
+            return row[0]
+        return None
+
+    def set(self, key: str, kind: str, response: str):
+        """Store a response."""
+        self._remember(key, kind, response)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, kind, response, ts) VALUES (?, ?, ?, ?)",
+                    (key, kind, response, time.time())
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing LLM cache: {e}")
+
+    def _remember(self, key: str, kind: str, response: str):
+        """Keep a response in the in-memory layer, evicting the oldest."""
+        self._memory[(key, kind)] = response
+        self._memory.move_to_end((key, kind))
+        if len(self._memory) > self.MEMORY_SIZE:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry."""
+        self._memory.clear()
+        super().clear()
+
+
+class TemplateCache(_SQLiteStore):
+    """Verdicts shared by recurring emails that follow the same template.
+
+    Newsletters and notifications from one sender differ mostly in numbers
+    (dates, order ids, counts), so their category, priority and deletable
+    verdict can be reused without asking the LLM again.
+    """
+
+    TABLE = "templates"
+    SCHEMA = """CREATE TABLE IF NOT EXISTS templates (
+        key TEXT PRIMARY KEY,
+        verdict TEXT NOT NULL,
+        ref_subject TEXT NOT NULL,
+        freq INTEGER NOT NULL
+    )"""
+
+    def __init__(self, path: Path = None):
+        super().__init__(path)
+        self._entries: Optional[dict] = None
+        # Keys whose hit count changed since the last flush()
+        self._dirty: set[str] = set()
+
+    @staticmethod
+    def key_for(email: Email) -> str:
+        """Key an email by sender, subject with digits masked, and body size."""
+        subject = re.sub(r"\d+", "#", email.subject)[:80]
+        # The server-side size, so a preview-length fetch keys like a full one
+        size = email.body_size or len(email.body)
+        return f"{email.sender}|{subject}|{size.bit_length()}"
+
+    def _load(self) -> dict:
+        """Load all templates once, hottest first."""
+        if self._entries is None:
+            self._entries = {}
+            try:
+                rows = self._connect().execute(
+                    "SELECT key, verdict, ref_subject, freq FROM templates ORDER BY freq DESC"
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"Error reading template cache: {e}")
+                rows = []
+            for key, verdict, ref_subject, freq in rows:
+                self._entries[key] = {"verdict": json.loads(verdict), "ref_subject": ref_subject, "freq": freq}
+        return self._entries
+
+    def get(self, email: Email, field: str):
+        """Return the remembered value of field for this email's template, or None."""
+        key = self.key_for(email)
+        entry = self._load().get(key)
+        if entry is None or field not in entry["verdict"]:
+            return None
+
+        # Counted in memory; written in one transaction by flush()
+        entry["freq"] += 1
+        self._dirty.add(key)
+        return entry["verdict"][field]
+
+    def put(self, email: Email, **verdict):
+        """Remember verdict fields for this email's template."""
+        key = self.key_for(email)
+        entries = self._load()
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = {"verdict": {}, "ref_subject": email.subject, "freq": 1}
+        elif verdict.items() <= entry["verdict"].items():
+            return
+        entry["verdict"].update(verdict)
+        self._save(key, entry)
+
+    def _save(self, key: str, entry: dict):
+        """Write one template back to SQLite."""
+        self._dirty.discard(key)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO templates (key, verdict, ref_subject, freq) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(entry["verdict"]), entry["ref_subject"], entry["freq"])
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing template cache: {e}")
+
+    def flush(self):
+        """Write pending hit counts back to SQLite."""
+        if not self._dirty:
+            return
+        rows = [(self._entries[key]["freq"], key) for key in self._dirty if key in self._entries]
+        self._dirty.clear()
+        try:
+            with self._connect() as conn:
+                conn.executemany("UPDATE templates SET freq = ? WHERE key = ?", rows)
+        except sqlite3.Error as e:
+            print(f"Error writing template cache: {e}")
+
+    def clear(self):
+        """Remove every entry."""
+        self._entries = None
+        self._dirty.clear()
+        super().clear()
@@ -1,42 +1,89 @@
 """
 Configuration for the email agent.
 Uses environment variables for sensitive data.
+
+Configs are built on first use rather than at import, so importing a
+module stays cheap and tests can set the environment beforehand.
 """
 
 import os
-from dataclasses import dataclass
-from dotenv import load_dotenv
+from dataclasses import dataclass, field
+from functools import cache
+
+
+@cache
+def _load_env():
+    """Load .env into the environment, once."""
+    from dotenv import load_dotenv
+    load_dotenv()
 
-load_dotenv()
+
+def _env(name: str, default: str, cast=str):
+    """Dataclass field read from the environment when the config is created."""
+    return field(default_factory=lambda: cast(os.getenv(name, default)))
 
 
 @dataclass
 class EmailConfig:
     """IMAP email configuration."""
-    imap_server: str = os.getenv("IMAP_SERVER", "")
-    imap_port: int = int(os.getenv("IMAP_PORT", "993"))
-    smtp_server: str = os.getenv("SMTP_SERVER", "")
-    smtp_port: int = int(os.getenv("SMTP_PORT", "587"))
-    email: str = os.getenv("EMAIL_ADDRESS", "")
-    password: str = os.getenv("EMAIL_PASSWORD", "")
+    imap_server: str = _env("IMAP_SERVER", "")
+    imap_port: int = _env("IMAP_PORT", "993", int)
+    smtp_server: str = _env("SMTP_SERVER", "")
+    smtp_port: int = _env("SMTP_PORT", "587", int)
+    email: str = _env("EMAIL_ADDRESS", "")
+    password: str = _env("EMAIL_PASSWORD", "")
 
 
 @dataclass
 class LLMConfig:
     """Ollama LLM configuration."""
-    base_url: str = os.getenv("OLLAMA_URL", "http://localhost:11434")
-    model: str = os.getenv("OLLAMA_MODEL", "qwen2.5:7b")
-    temperature: float = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+    base_url: str = _env("OLLAMA_URL", "http://localhost:11434")
+    model: str = _env("OLLAMA_MODEL", "qwen2.5:7b")
+    temperature: float = _env("LLM_TEMPERATURE", "0.7", float)
+    keep_alive: str = _env("OLLAMA_KEEP_ALIVE", "30m")
 
 
 @dataclass
 class AgentConfig:
     """Agent behavior configuration."""
-    max_emails_to_fetch: int = int(os.getenv("MAX_EMAILS", "10"))
-    summary_max_words: int = int(os.getenv("SUMMARY_MAX_WORDS", "100"))
+    max_emails_to_fetch: int = _env("MAX_EMAILS", "10", int)
+    summary_max_words: int = _env("SUMMARY_MAX_WORDS", "100", int)
+    max_concurrent_llm: int = _env("MAX_CONCURRENT_LLM", "4", int)
+    max_body_chars: int = _env("MAX_BODY_CHARS", "4000", int)
+    prefetch_emails: int = _env("PREFETCH_EMAILS", "50", int)
+    llm_batch_size: int = _env("LLM_BATCH_SIZE", "10", int)
+
+
+@cache
+def get_email_config() -> EmailConfig:
+    """Return the shared email configuration."""
+    _load_env()
+    return EmailConfig()
+
+
+@cache
+def get_llm_config() -> LLMConfig:
+    """Return the shared LLM configuration."""
+    _load_env()
+    return LLMConfig()
+
+
+@cache
+def get_agent_config() -> AgentConfig:
+    """Return the shared agent configuration."""
+    _load_env()
+    return AgentConfig()
+
+
+_GETTERS = {
+    "email_config": get_email_config,
+    "llm_config": get_llm_config,
+    "agent_config": get_agent_config,
+}
 
 
-# Global config instances
-email_config = EmailConfig()
-llm_config = LLMConfig()
-agent_config = AgentConfig()
+def __getattr__(name: str):
+    """Keep `from config import email_config` working, built on first access."""
+    if name in _GETTERS:
+        return _GETTERS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
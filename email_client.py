@@ -2,27 +2,60 @@
 IMAP email client for fetching and managing emails.
 """
 
+import base64
+import binascii
 import imaplib
+import quopri
+import re
 import smtplib
-import email
+import threading
+import time
+from collections import OrderedDict
+from itertools import takewhile
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.header import decode_header
+from email.parser import BytesHeaderParser
 from dataclasses import dataclass
 from typing import Optional
-from config import email_config
+from config import get_email_config
+
+# Bodies up to this size are fetched whole; larger ones only partially.
+FULL_BODY_LIMIT = 64 * 1024
+PARTIAL_BODY_BYTES = 8192
+# Enough of a body to preview and triage an email
+PREVIEW_BODY_BYTES = 1024
+# Keep each UID FETCH command line short enough for strict servers.
+FETCH_CHUNK_SIZE = 100
+
+# Only headers are parsed client-side; body parts arrive already split out.
+_HEADER_PARSER = BytesHeaderParser()
+
+# Patterns applied to every FETCH response, compiled once
+_UID_RE = re.compile(rb"UID (\d+)")
+_FLAGS_RE = re.compile(rb"FLAGS \(([^)]*)\)")
+_MESSAGE_START_RE = re.compile(rb"\d+ \(")
+_LITERAL_ITEM_RE = re.compile(rb"(BODY\[[^\]]*\](?:<\d+>)?|RFC822(?:\.\w+)?) \{\d+\}$")
+_LITERAL_RE = re.compile(rb"\{\d+\}$")
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+_ESCAPE_RE = re.compile(rb"\\(.)")
+_NON_BASE64_RE = re.compile(rb"[^A-Za-z0-9+/=]")
+_HTML_BLOCK_RE = re.compile(r"<(style|script)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_HTML_TAG_RE = re.compile(r"<[^>]*>")
 
 
 @dataclass
 class Email:
     """Represents an email message."""
-    id: str
+    id: str  # IMAP UID, stable across expunges
     subject: str
     sender: str
     date: str
     body: str
     folder: str = "INBOX"
     flags: list = None
+    message_id: str = ""
+    body_size: int = 0  # Size of the text part on the server, however much was fetched
 
     def __post_init__(self):
         if self.flags is None:
@@ -36,18 +69,34 @@ class Email:
 class EmailClient:
     """IMAP email client for fetching and managing emails."""
 
+    # Servers drop idle connections; probe with NOOP after this many seconds.
+    KEEPALIVE_INTERVAL = 25
+    # Parsed emails kept in memory, keyed by (folder, UID)
+    CACHE_SIZE = 500
+
     def __init__(self):
-        self.config = email_config
+        self.config = get_email_config()
         self.imap: Optional[imaplib.IMAP4_SSL] = None
+        self._selected_folder: Optional[str] = None
+        self._last_used = 0.0
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _open(self) -> imaplib.IMAP4_SSL:
+        """Open and log in a new IMAP connection."""
+        imap = imaplib.IMAP4_SSL(
+            self.config.imap_server,
+            self.config.imap_port
+        )
+        imap.login(self.config.email, self.config.password)
+        return imap
 
     def connect(self) -> bool:
         """Connect to the IMAP server."""
         try:
-            self.imap = imaplib.IMAP4_SSL(
-                self.config.imap_server,
-                self.config.imap_port
-            )
-            self.imap.login(self.config.email, self.config.password)
+            self.imap = self._open()
+            self._selected_folder = None
+            self._last_used = time.monotonic()
             return True
         except Exception as e:
             print(f"Failed to connect: {e}")
@@ -61,6 +110,52 @@ class EmailClient:
             except:
                 pass
             self.imap = None
+            self._selected_folder = None
+
+    def ensure_connected(self, probe: bool = False) -> bool:
+        """Reuse the open connection, reconnecting if the server dropped it.
+
+        An idle connection is checked with NOOP; probe=True checks it even
+        if it was used recently.
+        """
+        if self.imap and (probe or time.monotonic() - self._last_used > self.KEEPALIVE_INTERVAL):
+            try:
+                self.imap.noop()
+            except (imaplib.IMAP4.error, OSError):
+                self.imap = None
+                self._selected_folder = None
+
+        if not self.imap and not self.connect():
+            return False
+
+        self._last_used = time.monotonic()
+        return True
+
+    def _with_imap(self, operation, folder: Optional[str] = None, retry: bool = True):
+        """Run operation() on the connection, reconnecting and retrying once if it was dropped.
+
+        Pass retry=False for operations that are unsafe to repeat; the
+        connection is still dropped so the next call reconnects.
+        """
+        try:
+            if folder:
+                self._select(folder)
+            return operation()
+        except (imaplib.IMAP4.abort, OSError):
+            self.disconnect()
+            if not retry or not self.connect():
+                raise
+            if folder:
+                self._select(folder)
+            return operation()
+        finally:
+            self._last_used = time.monotonic()
+
+    def _select(self, folder: str):
+        """SELECT a folder unless it is already the selected one."""
+        if folder != self._selected_folder:
+            self.imap.select(folder)
+            self._selected_folder = folder
 
     def _decode_header_value(self, value: str) -> str:
         """Decode an email header value."""
@@ -75,94 +170,308 @@ class EmailClient:
                 result.append(part)
         return " ".join(result)
 
-    def _get_email_body(self, msg: email.message.Message) -> str:
-        """Extract the body from an email message."""
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                if content_type == "text/plain":
-                    try:
-                        payload = part.get_payload(decode=True)
-                        charset = part.get_content_charset() or "utf-8"
-                        body = payload.decode(charset, errors="replace")
-                        break
-                    except:
-                        continue
-        else:
-            try:
-                payload = msg.get_payload(decode=True)
-                charset = msg.get_content_charset() or "utf-8"
-                body = payload.decode(charset, errors="replace")
-            except:
-                body = str(msg.get_payload())
-        return body.strip()
+    def _split_fetch_response(self, msg_data: list) -> list[list]:
+        """Split a FETCH response into [metadata, {item: literal}] per message."""
+        messages = []
+        for response_part in msg_data:
+            if isinstance(response_part, tuple):
+                text, literal = response_part
+            elif isinstance(response_part, bytes):
+                text, literal = response_part, None
+            else:
+                continue
+
+            # Each message's response starts with "<seq> ("; anything else
+            # continues the previous message after a literal.
+            if _MESSAGE_START_RE.match(text) or not messages:
+                messages.append([b"", {}])
+
+            if literal is not None:
+                item = _LITERAL_ITEM_RE.search(text)
+                if item:
+                    messages[-1][1][item.group(1).upper()] = literal
+                    text = text[:item.start()]
+                else:
+                    # A literal string inside BODYSTRUCTURE; its value is never used
+                    text = _LITERAL_RE.sub(b"NIL", text)
+
+            messages[-1][0] += text
+        return messages
+
+    def _get_literal(self, literals: dict, prefix: bytes) -> Optional[bytes]:
+        """Return the first fetched literal whose item name starts with prefix."""
+        return next((value for item, value in literals.items() if item.startswith(prefix)), None)
+
+    def _parse_list(self, data: bytes, pos: int) -> Optional[list]:
+        """Parse the parenthesized IMAP list starting at data[pos]."""
+        stack = [[]]
+        for match in _TOKEN_RE.finditer(data, pos):
+            opening, closing, quoted, atom = match.groups()
+            if opening:
+                stack.append([])
+            elif closing:
+                done = stack.pop()
+                if len(stack) == 1:
+                    return done
+                stack[-1].append(done)
+            elif quoted is not None:
+                stack[-1].append(_ESCAPE_RE.sub(rb"\1", quoted))
+            else:
+                stack[-1].append(None if atom.upper() == b"NIL" else atom)
+        return None
+
+    def _find_text_part(self, structure: list, part: str = "") -> Optional[tuple[str, list]]:
+        """Find the first text/plain part in a BODYSTRUCTURE, returning (number, fields)."""
+        if not structure:
+            return None
+
+        if isinstance(structure[0], list):
+            # Multipart: child parts come first, then the subtype and extensions
+            children = takewhile(lambda child: isinstance(child, list), structure)
+            for i, child in enumerate(children, 1):
+                found = self._find_text_part(child, f"{part}.{i}" if part else str(i))
+                if found:
+                    return found
+            return None
+
+        main_type = (structure[0] or b"").lower()
+        sub_type = (structure[1] or b"").lower() if len(structure) > 1 else b""
+        # A single-part message is used whatever its text subtype
+        if main_type == b"text" and (sub_type == b"plain" or not part):
+            return part or "1", structure
+        return None
+
+    def _decode_part(self, payload: bytes, fields: list) -> str:
+        """Decode a fetched body part using its BODYSTRUCTURE fields."""
+        params = fields[2] if len(fields) > 2 and isinstance(fields[2], list) else []
+        charset = "utf-8"
+        for key, value in zip(params[::2], params[1::2]):
+            if key and key.lower() == b"charset" and value:
+                charset = value.decode(errors="replace")
+
+        encoding = (fields[5] or b"").lower() if len(fields) > 5 else b""
+        try:
+            if encoding == b"base64":
+                data = _NON_BASE64_RE.sub(b"", payload)
+                # A partial fetch may end mid-quantum
+                payload = base64.b64decode(data[:len(data) - len(data) % 4])
+            elif encoding == b"quoted-printable":
+                payload = quopri.decodestring(payload)
+        except (binascii.Error, ValueError):
+            pass
+
+        try:
+            text = payload.decode(charset, errors="replace")
+        except LookupError:
+            text = payload.decode("utf-8", errors="replace")
+
+        # HTML-only messages: keep just the text, cheaply
+        if len(fields) > 1 and (fields[1] or b"").lower() == b"html":
+            text = _HTML_TAG_RE.sub(" ", _HTML_BLOCK_RE.sub(" ", text))
+        return text.strip()
+
+    @staticmethod
+    def _uid_sets(ids: list[bytes]):
+        """Yield comma-joined UID sets of at most FETCH_CHUNK_SIZE UIDs."""
+        for i in range(0, len(ids), FETCH_CHUNK_SIZE):
+            yield b",".join(ids[i:i + FETCH_CHUNK_SIZE])
+
+    def _fetch_bodies(self, imap: imaplib.IMAP4, text_parts: dict, max_body_bytes: Optional[int] = None) -> dict:
+        """Fetch the text parts of several messages, one FETCH per distinct part spec."""
+        full_limit = max_body_bytes or FULL_BODY_LIMIT
+        partial_bytes = max_body_bytes or PARTIAL_BODY_BYTES
+        groups = {}
+        for msg_id, (part, fields) in text_parts.items():
+            size = fields[6] if len(fields) > 6 and fields[6] else b"0"
+            if size.isdigit() and int(size) <= full_limit:
+                item = f"BODY.PEEK[{part}]"
+            else:
+                item = f"BODY.PEEK[{part}]<0.{partial_bytes}>"
+            groups.setdefault(item, []).append(msg_id)
+
+        bodies = {}
+        for item, msg_ids in groups.items():
+            msg_data = []
+            for uid_set in self._uid_sets(msg_ids):
+                msg_data += imap.uid("FETCH", uid_set, f"({item})")[1]
+            for meta, literals in self._split_fetch_response(msg_data):
+                uid_match = _UID_RE.search(meta)
+                payload = self._get_literal(literals, b"BODY[")
+                if uid_match and payload is not None and uid_match.group(1) in text_parts:
+                    msg_id = uid_match.group(1)
+                    bodies[msg_id] = self._decode_part(payload, text_parts[msg_id][1])
+        return bodies
+
+    def _fetch_messages(
+        self,
+        imap: imaplib.IMAP4,
+        ids: list[bytes],
+        folder: str,
+        max_body_bytes: Optional[int] = None
+    ) -> dict:
+        """Fetch and parse the given UIDs, returning {uid: Email}."""
+        # One UID FETCH per chunk for the headers and structure of the set.
+        # BODY.PEEK leaves \Seen untouched, and attachments and HTML
+        # alternatives are never downloaded.
+        msg_data = []
+        for uid_set in self._uid_sets(ids):
+            msg_data += imap.uid(
+                "FETCH", uid_set,
+                "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)] BODYSTRUCTURE FLAGS)"
+            )[1]
+
+        by_id = {}
+        text_parts = {}
+        for meta, literals in self._split_fetch_response(msg_data):
+            uid_match = _UID_RE.search(meta)
+            if not uid_match:
+                continue
+
+            flags_match = _FLAGS_RE.search(meta)
+            flags = flags_match.group(1).decode().split() if flags_match else []
+
+            msg = _HEADER_PARSER.parsebytes(self._get_literal(literals, b"BODY[HEADER") or b"")
+            msg_id = uid_match.group(1)
+            by_id[msg_id] = Email(
+                id=msg_id.decode(),
+                subject=self._decode_header_value(msg["Subject"]),
+                sender=self._decode_header_value(msg["From"]),
+                date=msg["Date"] or "",
+                body="",
+                folder=folder,
+                flags=flags,
+                message_id=(msg["Message-ID"] or "").strip()
+            )
+
+            structure_at = meta.find(b"BODYSTRUCTURE (")
+            if structure_at != -1:
+                structure = self._parse_list(meta, structure_at + len(b"BODYSTRUCTURE "))
+                text_part = self._find_text_part(structure)
+                if text_part:
+                    text_parts[msg_id] = text_part
+                    fields = text_part[1]
+                    size = fields[6] if len(fields) > 6 and fields[6] else b"0"
+                    by_id[msg_id].body_size = int(size) if size.isdigit() else 0
+
+        for msg_id, body in self._fetch_bodies(imap, text_parts, max_body_bytes).items():
+            by_id[msg_id].body = body
+        return by_id
+
+    def _fetch_recent(
+        self,
+        folder: str,
+        limit: int,
+        unread_only: bool,
+        max_body_bytes: Optional[int] = None
+    ) -> list[Email]:
+        """Fetch the newest emails from the selected folder, newest first."""
+        search_criteria = "UNSEEN" if unread_only else "ALL"
+        _, message_ids = self.imap.uid("SEARCH", None, search_criteria)
+
+        ids = message_ids[0].split()
+        # Get most recent emails first
+        ids = ids[-limit:] if len(ids) > limit else ids
+        ids = list(reversed(ids))
+        if not ids:
+            return []
+
+        # Serve what the cache already holds and fetch only the misses
+        cached = {}
+        with self._cache_lock:
+            for msg_id in ids:
+                if (folder, msg_id) in self._cache:
+                    self._cache.move_to_end((folder, msg_id))
+                    cached[msg_id] = self._cache[(folder, msg_id)]
+        misses = [msg_id for msg_id in ids if msg_id not in cached]
+
+        by_id = self._fetch_messages(self.imap, misses, folder, max_body_bytes) if misses else {}
+        if not max_body_bytes:
+            # Truncated bodies must not be served later as full ones
+            self._remember(folder, by_id)
+
+        if cached:
+            # Flags may have changed since the message was cached
+            msg_data = []
+            for uid_set in self._uid_sets(list(cached)):
+                msg_data += self.imap.uid("FETCH", uid_set, "(FLAGS)")[1]
+            for meta, _ in self._split_fetch_response(msg_data):
+                uid_match = _UID_RE.search(meta)
+                flags_match = _FLAGS_RE.search(meta)
+                if uid_match and flags_match and uid_match.group(1) in cached:
+                    cached[uid_match.group(1)].flags = flags_match.group(1).decode().split()
+            by_id.update(cached)
+
+        return [by_id[msg_id] for msg_id in ids if msg_id in by_id]
 
     def fetch_emails(
         self,
         folder: str = "INBOX",
         limit: int = 10,
-        unread_only: bool = False
+        unread_only: bool = False,
+        max_body_bytes: Optional[int] = None
     ) -> list[Email]:
-        """Fetch emails from the specified folder."""
-        if not self.imap:
-            if not self.connect():
-                return []
-
-        emails = []
-        try:
-            self.imap.select(folder)
+        """Fetch emails from the specified folder.
 
-            search_criteria = "UNSEEN" if unread_only else "ALL"
-            _, message_ids = self.imap.search(None, search_criteria)
-
-            ids = message_ids[0].split()
-            # Get most recent emails first
-            ids = ids[-limit:] if len(ids) > limit else ids
-            ids = list(reversed(ids))
-
-            for msg_id in ids:
-                _, msg_data = self.imap.fetch(msg_id, "(RFC822 FLAGS)")
-
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-
-                        # Get flags
-                        flags = []
-                        flag_data = self.imap.fetch(msg_id, "(FLAGS)")
-                        if flag_data[1] and flag_data[1][0]:
-                            flag_str = flag_data[1][0].decode()
-                            if "FLAGS" in flag_str:
-                                start = flag_str.find("(", flag_str.find("FLAGS"))
-                                end = flag_str.find(")", start)
-                                if start != -1 and end != -1:
-                                    flags = flag_str[start+1:end].split()
-
-                        emails.append(Email(
-                            id=msg_id.decode(),
-                            subject=self._decode_header_value(msg["Subject"]),
-                            sender=self._decode_header_value(msg["From"]),
-                            date=msg["Date"] or "",
-                            body=self._get_email_body(msg),
-                            folder=folder,
-                            flags=flags
-                        ))
+        max_body_bytes caps how much of each body is downloaded, for callers
+        that only need a preview.
+        """
+        if not self.ensure_connected():
+            return []
 
+        try:
+            return self._with_imap(
+                lambda: self._fetch_recent(folder, limit, unread_only, max_body_bytes), folder
+            )
         except Exception as e:
             print(f"Error fetching emails: {e}")
+            return []
+
+    def _remember(self, folder: str, by_id: dict):
+        """Add fetched emails to the cache, evicting the least recently used."""
+        with self._cache_lock:
+            for msg_id, message in by_id.items():
+                self._cache[(folder, msg_id)] = message
+                self._cache.move_to_end((folder, msg_id))
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def prefetch(self, folder: str = "INBOX", limit: int = 50):
+        """Warm the cache with the latest emails over a separate connection.
+
+        Meant to run on a background thread; imaplib connections are not
+        thread-safe, so this never touches self.imap.
+        """
+        try:
+            imap = self._open()
+        except Exception:
+            # Connection problems are reported by the foreground check
+            return
 
-        return emails
+        try:
+            imap.select(folder, readonly=True)
+            _, message_ids = imap.uid("SEARCH", None, "ALL")
+            ids = message_ids[0].split()[-limit:]
+
+            with self._cache_lock:
+                misses = [msg_id for msg_id in ids if (folder, msg_id) not in self._cache]
+            if misses:
+                self._remember(folder, self._fetch_messages(imap, misses, folder))
+        except Exception:
+            pass
+        finally:
+            try:
+                imap.logout()
+            except:
+                pass
 
     def get_folders(self) -> list[str]:
         """Get list of available folders."""
-        if not self.imap:
-            if not self.connect():
-                return []
+        if not self.ensure_connected():
+            return []
 
         folders = []
         try:
-            _, folder_list = self.imap.list()
+            _, folder_list = self._with_imap(lambda: self.imap.list())
             for folder_data in folder_list:
                 if isinstance(folder_data, bytes):
                     # Parse folder name from response
@@ -175,34 +484,80 @@ class EmailClient:
 
         return folders
 
-    def move_email(self, email_id: str, dest_folder: str) -> bool:
+    def move_email(self, email_id: str, dest_folder: str, folder: str = "INBOX") -> bool:
         """Move an email to a different folder."""
-        if not self.imap:
+        return self.move_emails([email_id], dest_folder, folder)
+
+    def move_emails(self, email_ids: list[str], dest_folder: str, folder: str = "INBOX") -> bool:
+        """Move several emails to one folder with a single COPY, STORE and EXPUNGE."""
+        if not email_ids:
+            return True
+        if not self.ensure_connected():
             return False
 
-        try:
-            # Copy to destination
-            self.imap.copy(email_id.encode(), dest_folder)
+        uid_set = ",".join(email_ids).encode()
+
+        def delete_originals():
             # Mark as deleted in source
-            self.imap.store(email_id.encode(), "+FLAGS", "\\Deleted")
+            self.imap.uid("STORE", uid_set, "+FLAGS", "\\Deleted")
             self.imap.expunge()
+
+        try:
+            # Copy to destination. Not retried: if the connection drops after
+            # the server ran it, repeating it would duplicate the batch.
+            typ, data = self._with_imap(lambda: self.imap.uid("COPY", uid_set, dest_folder), folder, retry=False)
+            # A refused COPY (e.g. TRYCREATE) must not go on to delete the originals
+            if typ != "OK":
+                print(f"Error moving emails: {data}")
+                return False
+            # Flagging and expunging are safe to repeat after a reconnect
+            self._with_imap(delete_originals, folder)
             return True
         except Exception as e:
-            print(f"Error moving email: {e}")
+            print(f"Error moving emails: {e}")
             return False
 
-    def mark_as_read(self, email_id: str) -> bool:
+    def mark_as_read(self, email_id: str, folder: str = "INBOX") -> bool:
         """Mark an email as read."""
-        if not self.imap:
+        if not self.ensure_connected():
             return False
 
         try:
-            self.imap.store(email_id.encode(), "+FLAGS", "\\Seen")
+            self._with_imap(lambda: self.imap.uid("STORE", email_id.encode(), "+FLAGS", "\\Seen"), folder)
             return True
         except Exception as e:
             print(f"Error marking as read: {e}")
             return False
 
+    def delete_email(self, email_id: str, folder: str = "INBOX") -> bool:
+        """Delete a single email by ID."""
+        return self.delete_emails([email_id], folder) == 1
+
+    def delete_emails(self, email_ids: list[str], folder: str = "INBOX") -> int:
+        """Delete emails with one UID STORE per chunk and a single EXPUNGE. Returns count of deleted."""
+        if not email_ids:
+            return 0
+        if not self.ensure_connected():
+            return 0
+
+        def delete():
+            deleted = 0
+            uids = [email_id.encode() for email_id in email_ids]
+            for start in range(0, len(uids), FETCH_CHUNK_SIZE):
+                chunk = uids[start:start + FETCH_CHUNK_SIZE]
+                # Only count UIDs the server agreed to flag
+                typ, _ = self.imap.uid("STORE", b",".join(chunk), "+FLAGS", "\\Deleted")
+                if typ == "OK":
+                    deleted += len(chunk)
+            self.imap.expunge()
+            return deleted
+
+        try:
+            return self._with_imap(delete, folder)
+        except Exception as e:
+            print(f"Error deleting emails: {e}")
+            return 0
+
     def send_email(self, to: str, subject: str, body: str) -> bool:
         """Send an email via SMTP."""
         try:
@@ -223,8 +578,9 @@ class EmailClient:
             return False
 
     def __enter__(self):
-        self.connect()
+        # The connection outlives the block so later calls skip TLS + LOGIN
+        self.ensure_connected()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.disconnect()
+        pass
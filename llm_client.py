@@ -2,41 +2,142 @@
 Ollama LLM client using OpenAI-compatible API.
 """
 
+import asyncio
+import json
+from typing import Iterator, Optional
+import httpx
 from openai import OpenAI
-from config import llm_config
+from config import get_llm_config, get_agent_config
+
+LLM_ERROR_PREFIX = "Error communicating with LLM"
+
+# Generation on CPU-only machines can be slow, so be generous
+REQUEST_TIMEOUT = httpx.Timeout(300, connect=5)
+# Enough pooled keep-alive connections for every concurrent request
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+
+# Long bodies are summarized in at most this many chunks before reducing
+MAX_SUMMARY_CHUNKS = 4
+
+DEFAULT_CATEGORIES = ["Important", "Work", "Personal", "Newsletter", "Spam", "Other"]
 
 
 class LLMClient:
     """Client for interacting with local Ollama models."""
 
     def __init__(self):
-        self.config = llm_config
+        self.config = get_llm_config()
+        self.agent_config = get_agent_config()
+        # One pooled connection set shared by every synchronous request
+        self._sync_http = httpx.Client(limits=HTTP_LIMITS, timeout=REQUEST_TIMEOUT)
         self.client = OpenAI(
             base_url=f"{self.config.base_url}/v1",
-            api_key="ollama"  # Ollama doesn't need a real key
+            api_key="ollama",  # Ollama doesn't need a real key
+            http_client=self._sync_http
         )
+        self._http: Optional[httpx.AsyncClient] = None
+        # Failed requests so far; lets callers tell parsed answers from fallbacks
+        self.error_count = 0
 
-    def chat(self, prompt: str, system_prompt: str = None) -> str:
-        """Send a chat message and get a response."""
+    def _async_http(self) -> httpx.AsyncClient:
+        """Pooled async HTTP client, so concurrent requests reuse connections."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=f"{self.config.base_url}/v1",
+                headers={"Authorization": "Bearer ollama"},
+                limits=HTTP_LIMITS,
+                timeout=REQUEST_TIMEOUT
+            )
+        return self._http
+
+    def _build_messages(self, prompt: str, system_prompt: str = None) -> list[dict]:
+        """Build the message list for a chat request."""
         messages = []
 
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
 
         messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _request_options(self, json_mode: bool) -> dict:
+        """Extra options for a chat completion request."""
+        # keep_alive stops Ollama unloading the model between digests
+        options = {"extra_body": {"keep_alive": self.config.keep_alive}}
+        if json_mode:
+            options["response_format"] = {"type": "json_object"}
+        return options
 
+    def chat(self, prompt: str, system_prompt: str = None, json_mode: bool = False, **options) -> str:
+        """Send a chat message and get a response."""
         try:
             response = self.client.chat.completions.create(
                 model=self.config.model,
-                messages=messages,
-                temperature=self.config.temperature
+                messages=self._build_messages(prompt, system_prompt),
+                temperature=self.config.temperature,
+                **self._request_options(json_mode),
+                **options
             )
             return response.choices[0].message.content
         except Exception as e:
-            return f"Error communicating with LLM: {e}"
+            self.error_count += 1
+            return f"{LLM_ERROR_PREFIX}: {e}"
 
-    def summarize(self, text: str, max_words: int = 100) -> str:
-        """Summarize the given text."""
+    async def achat(self, prompt: str, system_prompt: str = None, json_mode: bool = False, **options) -> str:
+        """Async version of chat, so independent requests can run concurrently."""
+        payload = {
+            "model": self.config.model,
+            "messages": self._build_messages(prompt, system_prompt),
+            "temperature": self.config.temperature,
+            "keep_alive": self.config.keep_alive,
+            **options
+        }
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+
+        try:
+            response = await self._async_http().post("/chat/completions", json=payload)
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"]["content"]
+        except Exception as e:
+            self.error_count += 1
+            return f"{LLM_ERROR_PREFIX}: {e}"
+
+    def chat_short(self, prompt: str, system_prompt: str = None, max_tokens: int = 4, stop: list[str] = None) -> str:
+        """Get a one-word answer, letting the server stop after a few tokens."""
+        return self.chat(prompt, system_prompt, max_tokens=max_tokens, stop=stop or ["\n"])
+
+    async def achat_short(self, prompt: str, system_prompt: str = None, max_tokens: int = 4, stop: list[str] = None) -> str:
+        """Async version of chat_short."""
+        return await self.achat(prompt, system_prompt, max_tokens=max_tokens, stop=stop or ["\n"])
+
+    def chat_stream(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """Yield the response as it is generated, so callers can render or stop early."""
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.config.model,
+                messages=self._build_messages(prompt, system_prompt),
+                temperature=self.config.temperature,
+                stream=True,
+                **self._request_options(False)
+            )
+        except Exception as e:
+            self.error_count += 1
+            yield f"{LLM_ERROR_PREFIX}: {e}"
+            return
+
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            self.error_count += 1
+            yield f"\n\n{LLM_ERROR_PREFIX}: {e}"
+        finally:
+            stream.close()
+
+    def _summarize_prompt(self, text: str, max_words: int) -> tuple[str, str]:
+        """Build the (prompt, system_prompt) pair for summarization."""
         system_prompt = """You are a helpful assistant that summarizes emails concisely.
 Focus on: key points, action items, deadlines, and important details.
 Be brief and use bullet points when appropriate."""
@@ -45,10 +146,33 @@ Be brief and use bullet points when appropriate."""
 
 {text}"""
 
-        return self.chat(prompt, system_prompt)
+        return prompt, system_prompt
 
-    def draft_reply(self, email_subject: str, email_body: str, instructions: str = None) -> str:
-        """Draft a reply to an email."""
+    def _chunks(self, text: str) -> list[str]:
+        """Split text into prompt-sized chunks, dropping anything past the last one."""
+        size = self.agent_config.max_body_chars
+        return [text[i:i + size] for i in range(0, len(text), size)][:MAX_SUMMARY_CHUNKS]
+
+    def summarize(self, text: str, max_words: int = 100) -> str:
+        """Summarize the given text."""
+        chunks = self._chunks(text)
+        if len(chunks) > 1:
+            # Map-reduce: summarize each chunk, then summarize the summaries
+            text = "\n\n".join(self.chat(*self._summarize_prompt(chunk, max_words)) for chunk in chunks)
+        return self.chat(*self._summarize_prompt(text[:self.agent_config.max_body_chars], max_words))
+
+    async def asummarize(self, text: str, max_words: int = 100) -> str:
+        """Async version of summarize, summarizing long text's chunks concurrently."""
+        chunks = self._chunks(text)
+        if len(chunks) > 1:
+            partials = await asyncio.gather(*[
+                self.achat(*self._summarize_prompt(chunk, max_words)) for chunk in chunks
+            ])
+            text = "\n\n".join(partials)
+        return await self.achat(*self._summarize_prompt(text[:self.agent_config.max_body_chars], max_words))
+
+    def _draft_reply_prompt(self, email_subject: str, email_body: str, instructions: str = None) -> tuple[str, str]:
+        """Build the (prompt, system_prompt) pair for drafting a reply."""
         system_prompt = """You are a helpful assistant that drafts professional email replies.
 Match the tone of the original email. Be concise but thorough.
 Only output the reply body, no subject line or headers."""
@@ -62,13 +186,18 @@ Subject: {email_subject}
         if instructions:
             prompt += f"\n\nAdditional instructions: {instructions}"
 
-        return self.chat(prompt, system_prompt)
+        return prompt, system_prompt
 
-    def categorize(self, email_subject: str, email_body: str, categories: list[str] = None) -> str:
-        """Categorize an email into a folder/label."""
-        if categories is None:
-            categories = ["Important", "Work", "Personal", "Newsletter", "Spam", "Other"]
+    def draft_reply(self, email_subject: str, email_body: str, instructions: str = None) -> str:
+        """Draft a reply to an email."""
+        return self.chat(*self._draft_reply_prompt(email_subject, email_body, instructions))
 
+    def stream_reply(self, email_subject: str, email_body: str, instructions: str = None) -> Iterator[str]:
+        """Yield a reply draft as it is generated."""
+        return self.chat_stream(*self._draft_reply_prompt(email_subject, email_body, instructions))
+
+    def _categorize_prompt(self, email_subject: str, email_body: str, categories: list[str]) -> tuple[str, str]:
+        """Build the (prompt, system_prompt) pair for categorization."""
         system_prompt = """You are a helpful assistant that categorizes emails.
 Only respond with the category name, nothing else."""
 
@@ -80,7 +209,10 @@ Subject: {email_subject}
 
 Category:"""
 
-        response = self.chat(prompt, system_prompt)
+        return prompt, system_prompt
+
+    def _parse_category(self, response: str, categories: list[str]) -> str:
+        """Map a raw LLM response onto one of the known categories."""
         # Clean up response to just get the category
         response = response.strip().split("\n")[0]
         # Validate it's one of the categories
@@ -89,22 +221,113 @@ Category:"""
                 return cat
         return "Other"
 
-    def extract_action_items(self, email_body: str) -> str:
-        """Extract action items from an email."""
+    def categorize(self, email_subject: str, email_body: str, categories: list[str] = None) -> str:
+        """Categorize an email into a folder/label."""
+        if categories is None:
+            categories = DEFAULT_CATEGORIES
+        response = self.chat_short(*self._categorize_prompt(email_subject, email_body, categories))
+        return self._parse_category(response, categories)
+
+    async def acategorize(self, email_subject: str, email_body: str, categories: list[str] = None) -> str:
+        """Async version of categorize."""
+        if categories is None:
+            categories = DEFAULT_CATEGORIES
+        response = await self.achat_short(*self._categorize_prompt(email_subject, email_body, categories))
+        return self._parse_category(response, categories)
+
+    def _action_items_prompt(self, email_body: str) -> tuple[str, str]:
+        """Build the (prompt, system_prompt) pair for action item extraction."""
         system_prompt = """You are a helpful assistant that extracts action items from emails.
 List each action item on a new line starting with '- '.
 If there are no action items, respond with 'No action items found.'"""
 
         prompt = f"""Extract all action items, tasks, or things that need to be done from this email:
 
-{email_body}"""
+{email_body[:self.agent_config.max_body_chars]}"""
 
-        return self.chat(prompt, system_prompt)
+        return prompt, system_prompt
 
-    def check_connection(self) -> bool:
-        """Check if Ollama is running and the model is available."""
+    def extract_action_items(self, email_body: str) -> str:
+        """Extract action items from an email."""
+        return self.chat(*self._action_items_prompt(email_body))
+
+    async def aextract_action_items(self, email_body: str) -> str:
+        """Async version of extract_action_items."""
+        return await self.achat(*self._action_items_prompt(email_body))
+
+    def _analyze_prompt(self, email_subject: str, sender: str, email_body: str, max_words: int) -> tuple[str, str]:
+        """Build the (prompt, system_prompt) pair for a combined analysis."""
+        system_prompt = f"""You are a helpful assistant that analyzes emails.
+Return JSON with keys summary, category, action_items, priority:
+- summary: the email summarized in {max_words} words or less
+- category: one of {", ".join(DEFAULT_CATEGORIES)}
+- action_items: a list of tasks or things that need to be done (empty if none)
+- priority: HIGH, MEDIUM, or LOW, considering urgency, sender importance, and deadlines"""
+
+        prompt = f"""Analyze this email:
+
+Subject: {email_subject}
+From: {sender}
+
+{email_body[:self.agent_config.max_body_chars]}"""
+
+        return prompt, system_prompt
+
+    def _parse_analysis(self, response: str) -> Optional[dict]:
+        """Validate a JSON analysis, returning None if the model ignored the format."""
+        try:
+            data = json.loads(response)
+        except (json.JSONDecodeError, TypeError):
+            return None
+
+        keys = {"summary", "category", "action_items", "priority"}
+        if not isinstance(data, dict) or not keys <= data.keys():
+            return None
+
+        action_items = data["action_items"]
+        if isinstance(action_items, list):
+            action_items = "\n".join(f"- {item}" for item in action_items)
+
+        return {
+            "summary": str(data["summary"]).strip(),
+            "category": self._parse_category(str(data["category"]), DEFAULT_CATEGORIES),
+            "action_items": str(action_items).strip() or "No action items found.",
+            "priority": str(data["priority"]).strip()
+        }
+
+    def analyze_email(self, email_subject: str, sender: str, email_body: str, max_words: int = 100) -> Optional[dict]:
+        """Summarize, categorize, prioritize and extract action items in one request."""
+        response = self.chat(*self._analyze_prompt(email_subject, sender, email_body, max_words), json_mode=True)
+        return self._parse_analysis(response)
+
+    async def aanalyze_email(self, email_subject: str, sender: str, email_body: str, max_words: int = 100) -> Optional[dict]:
+        """Async version of analyze_email."""
+        response = await self.achat(*self._analyze_prompt(email_subject, sender, email_body, max_words), json_mode=True)
+        return self._parse_analysis(response)
+
+    def warm_up(self) -> bool:
+        """Load the model into memory and keep it resident for keep_alive."""
         try:
-            response = self.chat("Say 'OK' if you're working.")
-            return "OK" in response.upper() or len(response) > 0
-        except:
+            response = self._sync_http.post(
+                f"{self.config.base_url}/api/generate",
+                json={"model": self.config.model, "prompt": "", "keep_alive": self.config.keep_alive},
+                timeout=httpx.Timeout(120, connect=5)
+            )
+            return response.status_code == 200
+        except httpx.HTTPError:
             return False
+
+    def close(self):
+        """Close the pooled synchronous connections."""
+        self.client.close()
+
+    async def aclose(self):
+        """Close the pooled async connections, if any were opened."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def check_connection(self) -> bool:
+        """Check if Ollama is running and the model is available."""
+        # An empty generate loads the model without spending tokens on a reply
+        return self.warm_up()
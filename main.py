@@ -3,16 +3,50 @@
 Email Agent CLI - AI-powered email assistant using local LLMs.
 """
 
+from __future__ import annotations
+
 import sys
+from typing import TYPE_CHECKING
 from rich.console import Console
-from rich.table import Table
 from rich.panel import Panel
-from rich.prompt import Prompt, Confirm
-from rich.markdown import Markdown
-from agent import EmailAgent
+from rich.prompt import Prompt, IntPrompt, Confirm
+from rich.text import Text
+
+# The agent (IMAP, LLM clients, caches) and heavier rich modules are
+# imported where first needed, so the menu appears quickly.
+if TYPE_CHECKING:
+    from agent import EmailAgent
+
+try:
+    import pyperclip
+except ImportError:
+    pyperclip = None
 
 console = Console()
 
+PRIORITY_COLORS = {"HIGH": "red", "MEDIUM": "yellow", "LOW": "green"}
+
+# Menus are parsed once and re-printed on each pass through their loops
+MAIN_MENU = Text.from_markup(
+    "\n[bold]What would you like to do?[/bold]\n\n"
+    "1. Daily digest\n"
+    "2. Browse inbox\n"
+    "3. Draft a reply\n"
+    "4. Organize inbox\n"
+    "5. [red]Clean inbox[/red] (find & delete junk)\n"
+    "6. Check status\n"
+    "7. Clear cache\n"
+    "8. Exit"
+)
+
+ACTION_MENU = Text.from_markup(
+    "[bold]Actions:[/bold]\n"
+    "  [cyan]<sender#>[/cyan]        - Delete all from that sender (e.g., '1')\n"
+    "  [cyan]<sender#.email#>[/cyan] - Delete single email (e.g., '1.2')\n"
+    "  [cyan]all[/cyan]             - Delete all deletable emails\n"
+    "  [cyan]done[/cyan]            - Exit cleanup"
+)
+
 
 def print_header():
     """Print the application header."""
@@ -23,10 +57,12 @@ def print_header():
     ))
 
 
-def check_status(agent: EmailAgent):
+def check_status(agent: EmailAgent, force: bool = False):
     """Check connection status."""
+    from rich.table import Table
+
     console.print("\n[yellow]Checking connections...[/yellow]")
-    status = agent.check_connections()
+    status = agent.check_connections(force=force)
 
     table = Table(show_header=False)
     table.add_column("Service", style="bold")
@@ -52,11 +88,15 @@ def check_status(agent: EmailAgent):
 
 def show_digest(agent: EmailAgent):
     """Show daily email digest."""
+    from rich.live import Live
+    from rich.markdown import Markdown
+
     console.print("\n[yellow]Generating daily digest...[/yellow]\n")
 
     try:
-        digest = agent.get_daily_digest()
-        console.print(Markdown(digest))
+        with Live(Markdown(""), console=console, refresh_per_second=8) as live:
+            for digest in agent.stream_daily_digest():
+                live.update(Markdown(digest))
     except Exception as e:
         console.print(f"[red]Error generating digest: {e}[/red]")
 
@@ -64,23 +104,15 @@ def show_digest(agent: EmailAgent):
 def show_inbox(agent: EmailAgent):
     """Show inbox summary."""
     unread_only = Confirm.ask("Show unread only?", default=True)
-    limit = int(Prompt.ask("How many emails?", default="5"))
+    limit = IntPrompt.ask("How many emails?", default=5)
 
     console.print("\n[yellow]Fetching and analyzing emails...[/yellow]\n")
 
     try:
-        summaries = agent.get_inbox_summary(limit=limit, unread_only=unread_only)
-
-        if not summaries:
-            console.print("[dim]No emails found.[/dim]")
-            return
-
-        for i, s in enumerate(summaries, 1):
-            priority_color = {
-                "HIGH": "red",
-                "MEDIUM": "yellow",
-                "LOW": "green"
-            }.get(s.priority, "white")
+        # Panels appear as each analysis finishes, fastest first
+        i = 0
+        for i, s in enumerate(agent.iter_inbox_summary(limit=limit, unread_only=unread_only), 1):
+            priority_color = PRIORITY_COLORS.get(s.priority, "white")
 
             console.print(Panel(
                 f"[bold]{s.email.subject}[/bold]\n"
@@ -89,56 +121,65 @@ def show_inbox(agent: EmailAgent):
                 f"[bold]Summary:[/bold] {s.summary}\n\n"
                 f"[bold]Category:[/bold] {s.category}\n"
                 f"[bold]Action Items:[/bold]\n{s.action_items}",
-                title=f"[{priority_color}]{s.priority}[/{priority_color}] Email {i}/{len(summaries)}",
+                title=f"[{priority_color}]{s.priority}[/{priority_color}] Email {i}",
                 border_style=priority_color
             ))
 
+        if not i:
+            console.print("[dim]No emails found.[/dim]")
+
     except Exception as e:
         console.print(f"[red]Error: {e}[/red]")
 
 
 def draft_reply_interactive(agent: EmailAgent):
     """Interactive reply drafting."""
-    console.print("\n[yellow]Fetching recent emails...[/yellow]")
+    from rich.live import Live
+    from rich.table import Table
 
-    with agent.email_client as client:
-        emails = client.fetch_emails(limit=5)
+    console.print("\n[yellow]Fetching recent emails...[/yellow]")
 
-        if not emails:
-            console.print("[dim]No emails found.[/dim]")
-            return
+    emails = agent.email_client.fetch_emails(limit=5)
 
-        table = Table(title="Recent Emails")
-        table.add_column("#", style="bold")
-        table.add_column("Subject")
-        table.add_column("From")
+    if not emails:
+        console.print("[dim]No emails found.[/dim]")
+        return
 
-        for i, email in enumerate(emails, 1):
-            table.add_row(str(i), email.subject[:50], email.sender[:30])
+    table = Table(title="Recent Emails")
+    table.add_column("#", style="bold")
+    table.add_column("Subject")
+    table.add_column("From")
 
-        console.print(table)
+    for i, email in enumerate(emails, 1):
+        table.add_row(str(i), email.subject[:50], email.sender[:30])
 
-        choice = Prompt.ask("Which email to reply to?", choices=[str(i) for i in range(1, len(emails)+1)])
-        email = emails[int(choice) - 1]
+    console.print(table)
 
-        instructions = Prompt.ask("Any specific instructions? (or press Enter to skip)", default="")
+    choices = [str(i) for i in range(1, len(emails) + 1)]
+    choice = Prompt.ask("Which email to reply to?", choices=choices)
+    email = emails[int(choice) - 1]
 
-        console.print("\n[yellow]Drafting reply...[/yellow]\n")
-        reply = agent.draft_reply(email, instructions if instructions else None)
+    instructions = Prompt.ask("Any specific instructions? (or press Enter to skip)", default="")
 
-        console.print(Panel(reply, title="Draft Reply", border_style="green"))
+    console.print("\n[yellow]Drafting reply...[/yellow]\n")
+    reply = ""
+    with Live(Panel(reply, title="Draft Reply", border_style="green"), console=console, refresh_per_second=8) as live:
+        for chunk in agent.stream_reply(email, instructions if instructions else None):
+            reply += chunk
+            live.update(Panel(reply, title="Draft Reply", border_style="green"))
 
-        if Confirm.ask("Copy to clipboard?", default=False):
-            try:
-                import subprocess
-                subprocess.run(['xclip', '-selection', 'clipboard'], input=reply.encode(), check=True)
-                console.print("[green]Copied to clipboard![/green]")
-            except:
-                console.print("[dim]Clipboard copy not available[/dim]")
+    if Confirm.ask("Copy to clipboard?", default=False):
+        try:
+            pyperclip.copy(reply)
+            console.print("[green]Copied to clipboard![/green]")
+        except:
+            console.print("[dim]Clipboard copy not available[/dim]")
 
 
 def organize_inbox(agent: EmailAgent):
     """Organize inbox by category."""
+    from rich.table import Table
+
     dry_run = Confirm.ask("Dry run (preview only)?", default=True)
 
     console.print("\n[yellow]Analyzing emails for organization...[/yellow]\n")
@@ -172,13 +213,22 @@ def organize_inbox(agent: EmailAgent):
 
 def clean_inbox(agent: EmailAgent):
     """Find and delete unimportant emails."""
-    limit = int(Prompt.ask("How many emails to scan?", default="30"))
+    from rich.console import Group
+    from rich.progress import Progress
+    from rich.table import Table
+
+    limit = IntPrompt.ask("How many emails to scan?", default=30)
 
     console.print("\n[yellow]Analyzing emails for deletable content...[/yellow]")
-    console.print("[dim]This may take a moment as each email is evaluated by the LLM.[/dim]\n")
+    console.print("[dim]This may take a moment as emails are evaluated by the LLM in batches.[/dim]\n")
 
     try:
-        deletable = agent.find_deletable_emails(limit=limit)
+        with Progress(console=console, transient=True) as progress:
+            task = progress.add_task("Classifying emails", total=None)
+            deletable = agent.find_deletable_emails(
+                limit=limit,
+                on_progress=lambda done, total: progress.update(task, completed=done, total=total)
+            )
 
         if not deletable:
             console.print("[green]No deletable emails found! Your inbox is clean.[/green]")
@@ -188,13 +238,10 @@ def clean_inbox(agent: EmailAgent):
         console.print(f"[yellow]Found {total_deletable} deletable email(s) from {len(deletable)} sender(s)[/yellow]\n")
 
         # Display grouped by sender
-        sender_num = 0
-        sender_map = {}
-
-        for sender, emails in deletable.items():
-            sender_num += 1
-            sender_map[sender_num] = {"sender": sender, "emails": emails}
+        senders: list[tuple[str, list]] = list(deletable.items())
+        tables = []
 
+        for sender_num, (sender, emails) in enumerate(senders, 1):
             table = Table(title=f"[bold]Sender {sender_num}:[/bold] {sender[:60]}", show_header=True)
             table.add_column("#", style="bold", width=4)
             table.add_column("Subject", width=40)
@@ -207,16 +254,20 @@ def clean_inbox(agent: EmailAgent):
                     email_data["preview"][:50]
                 )
 
-            console.print(table)
-            console.print("")
+            tables.extend((table, ""))
+
+        # One print for every table, rather than a flush per sender
+        console.print(Group(*tables))
+
+        # (sender#, email#) pairs not yet deleted; numbers stay as displayed
+        alive = {(s, e) for s, (_, emails) in enumerate(senders, 1) for e in range(1, len(emails) + 1)}
+        # Inputs are looked up, not parsed
+        email_keys = {f"{s}.{e}": (s, e) for s, e in alive}
+        sender_keys = {str(s): s for s in range(1, len(senders) + 1)}
 
         # Action menu
         while True:
-            console.print("[bold]Actions:[/bold]")
-            console.print("  [cyan]<sender#>[/cyan]        - Delete all from that sender (e.g., '1')")
-            console.print("  [cyan]<sender#.email#>[/cyan] - Delete single email (e.g., '1.2')")
-            console.print("  [cyan]all[/cyan]             - Delete all deletable emails")
-            console.print("  [cyan]done[/cyan]            - Exit cleanup")
+            console.print(ACTION_MENU)
 
             action = Prompt.ask("\nAction").strip().lower()
 
@@ -224,93 +275,90 @@ def clean_inbox(agent: EmailAgent):
                 break
 
             elif action == "all":
-                if Confirm.ask(f"[red]Delete ALL {total_deletable} emails?[/red]", default=False):
-                    deleted = 0
-                    for sender_data in sender_map.values():
-                        ids = [e["email"].id for e in sender_data["emails"]]
-                        deleted += agent.delete_emails_from_sender(ids)
+                if Confirm.ask(f"[red]Delete ALL {len(alive)} emails?[/red]", default=False):
+                    all_ids = [senders[s - 1][1][e - 1]["email"].id for s, e in sorted(alive)]
+                    deleted = agent.delete_emails_bulk(all_ids)
                     console.print(f"[green]Deleted {deleted} email(s)[/green]")
                     break
 
-            elif "." in action:
+            elif email_keys.get(action) in alive:
                 # Single email delete (e.g., "1.2")
-                try:
-                    sender_num, email_num = map(int, action.split("."))
-                    if sender_num in sender_map:
-                        emails = sender_map[sender_num]["emails"]
-                        if 1 <= email_num <= len(emails):
-                            email_data = emails[email_num - 1]
-                            if Confirm.ask(f"Delete '{email_data['subject'][:40]}'?", default=True):
-                                if agent.delete_email(email_data["email"].id):
-                                    console.print("[green]Deleted![/green]")
-                                    emails.pop(email_num - 1)
-                                else:
-                                    console.print("[red]Failed to delete[/red]")
-                        else:
-                            console.print("[red]Invalid email number[/red]")
+                sender_num, email_num = email_keys[action]
+                email_data = senders[sender_num - 1][1][email_num - 1]
+                if Confirm.ask(f"Delete '{email_data['subject'][:40]}'?", default=True):
+                    if agent.delete_email(email_data["email"].id):
+                        console.print("[green]Deleted![/green]")
+                        alive.discard((sender_num, email_num))
                     else:
-                        console.print("[red]Invalid sender number[/red]")
-                except ValueError:
-                    console.print("[red]Invalid format. Use sender#.email# (e.g., 1.2)[/red]")
+                        console.print("[red]Failed to delete[/red]")
 
-            else:
+            elif "." in action:
+                console.print("[red]Invalid email. Use sender#.email# (e.g., 1.2)[/red]")
+
+            elif action in sender_keys:
                 # Delete all from sender (e.g., "1")
-                try:
-                    sender_num = int(action)
-                    if sender_num in sender_map:
-                        sender_data = sender_map[sender_num]
-                        count = len(sender_data["emails"])
-                        if Confirm.ask(f"Delete all {count} email(s) from {sender_data['sender'][:40]}?", default=True):
-                            ids = [e["email"].id for e in sender_data["emails"]]
-                            deleted = agent.delete_emails_from_sender(ids)
-                            console.print(f"[green]Deleted {deleted} email(s)[/green]")
-                            del sender_map[sender_num]
-                    else:
-                        console.print("[red]Invalid sender number[/red]")
-                except ValueError:
-                    console.print("[red]Invalid input[/red]")
+                sender_num = sender_keys[action]
+                sender, emails = senders[sender_num - 1]
+                remaining = [(sender_num, e) for e in range(1, len(emails) + 1) if (sender_num, e) in alive]
+                if not remaining:
+                    console.print("[dim]Nothing left from that sender[/dim]")
+                elif Confirm.ask(f"Delete all {len(remaining)} email(s) from {sender[:40]}?", default=True):
+                    ids = [emails[e - 1]["email"].id for _, e in remaining]
+                    deleted = agent.delete_emails_bulk(ids)
+                    console.print(f"[green]Deleted {deleted} email(s)[/green]")
+                    alive.difference_update(remaining)
+
+            else:
+                console.print("[red]Invalid sender number[/red]")
 
     except Exception as e:
         console.print(f"[red]Error: {e}[/red]")
 
 
+def clear_cache(agent: EmailAgent):
+    """Forget cached LLM results."""
+    if Confirm.ask("Clear all cached email analysis?", default=False):
+        agent.clear_cache()
+        console.print("[green]Cache cleared.[/green]")
+
+
 def main_menu():
     """Show main menu and handle user input."""
+    print_header()
+
+    from agent import EmailAgent
+
     agent = EmailAgent()
 
-    print_header()
+    try:
+        if not check_status(agent):
+            console.print("\n[red]Please fix connection issues before continuing.[/red]")
+            sys.exit(1)
 
-    if not check_status(agent):
-        console.print("\n[red]Please fix connection issues before continuing.[/red]")
-        sys.exit(1)
-
-    while True:
-        console.print("\n[bold]What would you like to do?[/bold]\n")
-        console.print("1. Daily digest")
-        console.print("2. Browse inbox")
-        console.print("3. Draft a reply")
-        console.print("4. Organize inbox")
-        console.print("5. [red]Clean inbox[/red] (find & delete junk)")
-        console.print("6. Check status")
-        console.print("7. Exit")
-
-        choice = Prompt.ask("\nChoice", choices=["1", "2", "3", "4", "5", "6", "7"])
-
-        if choice == "1":
-            show_digest(agent)
-        elif choice == "2":
-            show_inbox(agent)
-        elif choice == "3":
-            draft_reply_interactive(agent)
-        elif choice == "4":
-            organize_inbox(agent)
-        elif choice == "5":
-            clean_inbox(agent)
-        elif choice == "6":
-            check_status(agent)
-        elif choice == "7":
-            console.print("\n[dim]Goodbye![/dim]")
-            break
+        while True:
+            console.print(MAIN_MENU)
+
+            choice = Prompt.ask("\nChoice", choices=["1", "2", "3", "4", "5", "6", "7", "8"])
+
+            if choice == "1":
+                show_digest(agent)
+            elif choice == "2":
+                show_inbox(agent)
+            elif choice == "3":
+                draft_reply_interactive(agent)
+            elif choice == "4":
+                organize_inbox(agent)
+            elif choice == "5":
+                clean_inbox(agent)
+            elif choice == "6":
+                check_status(agent, force=True)
+            elif choice == "7":
+                clear_cache(agent)
+            elif choice == "8":
+                console.print("\n[dim]Goodbye![/dim]")
+                break
+    finally:
+        agent.close()
 
 
 if __name__ == "__main__":
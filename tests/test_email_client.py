@@ -0,0 +1,150 @@
+"""
+Tests for the hand-rolled IMAP FETCH parsing in email_client.
+"""
+
+import base64
+import unittest
+from email_client import EmailClient
+
+HEADERS = b"Subject: Hello\r\nFrom: Ann <ann@example.com>\r\nDate: Mon, 1 Jan 2024 10:00:00 +0000\r\n\r\n"
+
+
+class FakeIMAP:
+    """Stand-in for imaplib.IMAP4 that answers UID commands from a callable."""
+
+    def __init__(self, fetch, uids=b"1"):
+        self.fetch = fetch
+        self.uids = uids
+        self.calls = []
+
+    def select(self, folder):
+        return "OK", [b"1"]
+
+    def noop(self):
+        return "OK", []
+
+    def uid(self, command, *args):
+        self.calls.append((command,) + args)
+        if command == "SEARCH":
+            return "OK", [self.uids]
+        if command == "FETCH":
+            return "OK", self.fetch(*args)
+        return "OK", [None]
+
+
+class SplitFetchResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.client = EmailClient()
+
+    def test_flags_before_literal(self):
+        msg_data = [
+            (b"1 (UID 7 FLAGS (\\Seen) BODY[HEADER.FIELDS (SUBJECT)] {16}", b"Subject: Hello\r\n"),
+            b")",
+        ]
+        [(meta, literals)] = self.client._split_fetch_response(msg_data)
+        self.assertIn(b"UID 7", meta)
+        self.assertIn(b"FLAGS (\\Seen)", meta)
+        self.assertEqual(literals, {b"BODY[HEADER.FIELDS (SUBJECT)]": b"Subject: Hello\r\n"})
+
+    def test_flags_after_literal(self):
+        msg_data = [
+            (b"1 (UID 7 BODY[HEADER.FIELDS (SUBJECT)] {16}", b"Subject: Hello\r\n"),
+            b" FLAGS (\\Flagged))",
+            (b"2 (UID 8 BODY[HEADER.FIELDS (SUBJECT)] {16}", b"Subject: Other\r\n"),
+            b" FLAGS ())",
+        ]
+        messages = self.client._split_fetch_response(msg_data)
+        self.assertEqual(len(messages), 2)
+        self.assertIn(b"FLAGS (\\Flagged)", messages[0][0])
+        self.assertIn(b"UID 8", messages[1][0])
+        self.assertEqual(messages[1][1][b"BODY[HEADER.FIELDS (SUBJECT)]"], b"Subject: Other\r\n")
+
+    def test_literal_inside_bodystructure(self):
+        msg_data = [
+            (b'1 (UID 3 BODYSTRUCTURE (("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1)'
+             b'("APPLICATION" "PDF" ("NAME" {5}', b"a.pdf"),
+            (b') NIL NIL "BASE64" 500) "MIXED") BODY[HEADER.FIELDS (SUBJECT)] {16}', b"Subject: Hello\r\n"),
+            b")",
+        ]
+        [(meta, literals)] = self.client._split_fetch_response(msg_data)
+        # The filename literal is replaced so BODYSTRUCTURE still parses
+        self.assertIn(b'("NAME" NIL)', meta)
+        self.assertEqual(list(literals), [b"BODY[HEADER.FIELDS (SUBJECT)]"])
+
+        structure = self.client._parse_list(meta, meta.find(b"BODYSTRUCTURE (") + len(b"BODYSTRUCTURE "))
+        self.assertEqual(self.client._find_text_part(structure)[0], "1")
+
+
+class FindTextPartTest(unittest.TestCase):
+    def setUp(self):
+        self.client = EmailClient()
+
+    def parse(self, data: bytes) -> list:
+        return self.client._parse_list(data, 0)
+
+    def test_nested_multipart(self):
+        structure = self.parse(
+            b'((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 5 1)'
+            b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 9 1) "ALTERNATIVE")'
+            b'("APPLICATION" "PDF" NIL NIL NIL "BASE64" 500) "MIXED")'
+        )
+        part, fields = self.client._find_text_part(structure)
+        self.assertEqual(part, "1.1")
+        self.assertEqual(fields[1], b"PLAIN")
+
+    def test_single_html_part(self):
+        structure = self.parse(b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 900 20)')
+        part, fields = self.client._find_text_part(structure)
+        self.assertEqual(part, "1")
+        self.assertEqual(fields[1], b"HTML")
+
+    def test_no_text_part(self):
+        structure = self.parse(b'("IMAGE" "PNG" NIL NIL NIL "BASE64" 10)')
+        self.assertIsNone(self.client._find_text_part(structure))
+
+
+class DecodePartTest(unittest.TestCase):
+    def setUp(self):
+        self.client = EmailClient()
+
+    def test_truncated_base64(self):
+        encoded = base64.encodebytes("héllo wörld, héllo wörld".encode())
+        fields = [b"TEXT", b"PLAIN", [b"CHARSET", b"utf-8"], None, None, b"BASE64", b"100"]
+        # A partial fetch can stop mid-quantum and mid-line
+        self.assertTrue(self.client._decode_part(encoded[:23], fields).startswith("héllo wö"))
+
+    def test_unknown_charset(self):
+        fields = [b"TEXT", b"PLAIN", [b"CHARSET", b"x-unknown"], None, None, b"7BIT", b"5"]
+        self.assertEqual(self.client._decode_part(b"plain", fields), "plain")
+
+    def test_quoted_printable_latin1(self):
+        fields = [b"TEXT", b"PLAIN", [b"CHARSET", b"iso-8859-1"], None, None, b"QUOTED-PRINTABLE", b"20"]
+        self.assertEqual(self.client._decode_part(b"caf=E9 na=\r\nive", fields), "café naive")
+
+
+class FetchEmailsTest(unittest.TestCase):
+    def test_headers_and_text_part(self):
+        def fetch(uid_set, items):
+            if "HEADER" in items:
+                return [
+                    (b'1 (UID 5 FLAGS (\\Seen) BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 5 1)'
+                     b'("TEXT" "HTML" NIL NIL NIL "7BIT" 9 1) "ALTERNATIVE") BODY[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID)] {%d}'
+                     % len(HEADERS), HEADERS),
+                    b")",
+                ]
+            return [(b"1 (UID 5 BODY[1] {5}", b"hello"), b")"]
+
+        client = EmailClient()
+        client.imap = FakeIMAP(fetch, uids=b"5")
+        [email] = client.fetch_emails(limit=1)
+
+        self.assertEqual(email.id, "5")
+        self.assertEqual(email.subject, "Hello")
+        self.assertEqual(email.sender, "Ann <ann@example.com>")
+        self.assertEqual(email.body, "hello")
+        self.assertEqual(email.flags, ["\\Seen"])
+        self.assertIn(("FETCH", b"5", "(BODY.PEEK[1])"), client.imap.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()